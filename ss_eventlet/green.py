@@ -1,12 +1,21 @@
 from __future__ import absolute_import
 
+import collections
 import functools
 import importlib
 import sys
+import threading
 from contextlib import contextmanager
 
 import eventlet
 
+try:
+    # python 3
+    from _imp import acquire_lock, release_lock
+except ImportError:
+    # python 2
+    from imp import acquire_lock, release_lock
+
 from . import utils
 
 # If the New Relic agent package is installed, instrument eventlet
@@ -21,17 +30,88 @@ except ImportError:
     def _nr_instrument(target_module, instrument_name):
         pass
 else:
+    # Instrumentation functions, keyed on instrument name.
+    _nr_instruments = {}
+
     def _nr_instrument(target_module, instrument_name):
-        instrument_parts = instrument_name.split(':', 1)
-        if len(instrument_parts) == 1:
-            instrument_parts.append('instrument')
-        instrument_module = importlib.import_module(instrument_parts[0])
-        instrument = getattr(instrument_module, instrument_parts[1])
+        try:
+            instrument = _nr_instruments[instrument_name]
+        except KeyError:
+            instrument_parts = instrument_name.split(':', 1)
+            if len(instrument_parts) == 1:
+                instrument_parts.append('instrument')
+            instrument_module = importlib.import_module(instrument_parts[0])
+            instrument = _nr_instruments[instrument_name] = getattr(
+                instrument_module, instrument_parts[1])
         instrument(target_module)
 
 
 _currently_patched_packages = {}
 
+# Maps the name of each patched module to the names of the modules which
+# importing it added to sys.modules, so that repeat patches of the module need
+# not import it again to discover them.
+_module_dependency_cache = {}
+
+# Maps the name of each patched module to (name, patched module) pairs for the
+# module and its ancestors, as installed in sys.modules by the last patch.
+_patched_module_cache = {}
+
+_PATCHED_MODULE_PREFIX = '__patched_module_'
+
+
+def _install_patched_module(
+        module_name, ancestors, original_modules, original_descendants,
+        added_modules):
+    """Patch a module and its ancestors and install them in sys.modules.
+
+    original_modules and original_descendants are the names of the modules
+    in sys.modules, and the subset of them in the root package, prior to
+    patching. The names of modules which the patch adds to sys.modules are
+    added to added_modules, so that they can be removed afterwards.
+    """
+    root_module = ancestors[0]
+    # Determine which modules (apart from the target module) the patching
+    # process will add to sys.modules, and freeze their state. Avoid freezing
+    # all of sys.modules, as eventlet caches patched modules in sys.modules.
+    # Repeat patches reuse the dependencies discovered by the first, which
+    # include every module in the root package, as those are the modules
+    # liable to be unloaded between patches.
+    try:
+        dependencies = _module_dependency_cache[module_name]
+    except KeyError:
+        # Diff against the whole of sys.modules, as imports can register
+        # modules without going through sys.meta_path, both within the root
+        # package (aliases such as requests.packages.*) and outside it.
+        importlib.import_module(module_name)
+        dependencies = set(sys.modules)
+        dependencies.difference_update(original_modules)
+        dependencies.update(original_descendants)
+        dependencies = frozenset(dependencies)
+        _module_dependency_cache[module_name] = dependencies
+    new_modules = dependencies - original_modules
+    utils.delete_sys_modules(new_modules)
+    added_modules.update(new_modules)
+
+    # Of the root package, only the originally loaded modules, and the target
+    # module if the probe import loaded it, remain in sys.modules.
+    utils.delete_sys_modules(original_descendants.union((module_name,)))
+    # Patch the target module and all of its ancestors, rather than just the
+    # target module, because import_patched caches patched modules, so
+    # subsequent calls to this function must restore the cached module's
+    # ancestry tree to avoid creating a rootless module.
+    for name in ancestors:
+        sys.modules[name] = eventlet.import_patched(name)
+    # Due to patched module caching, patches only import a module's
+    # dependencies the first time. Make repeat calls as consistent as possible
+    # by deregistering all unpatched modules in the root package from
+    # sys.modules.
+    utils.delete_sys_modules([
+        name for name in utils.iter_descendent_module_names(root_module)
+        if name not in ancestors])
+    _patched_module_cache[module_name] = tuple(
+        (name, sys.modules[name]) for name in ancestors)
+
 
 @contextmanager
 def _patch_package_module(module_name, additional_modules=None):
@@ -79,12 +159,18 @@ def _patch_package_module(module_name, additional_modules=None):
     """
     if additional_modules is None:
         additional_modules = []
-    ancestors = list(utils.iter_ancestor_module_names(module_name))
+    ancestors = utils.iter_ancestor_module_names(module_name)
     root_module = ancestors[0]
-    # Initialize the saver prior to examining sys.modules in order to acquire
-    # the import lock, preventing other threads from mutating sys.modules
-    # and other shared state during the patching process.
-    saver = eventlet.patcher.SysModulesSaver()
+    # Acquire the import lock prior to examining sys.modules, preventing other
+    # threads from mutating sys.modules and other shared state during the
+    # patching process.
+    acquire_lock()
+    # Snapshot sys.modules with a single dict copy, and separately track the
+    # modules absent from the snapshot which patching adds, as those must be
+    # removed rather than restored.
+    saved_modules = dict(sys.modules)
+    added_modules = set(
+        name for name in ancestors if name not in saved_modules)
     try:
         # The implementation does not support nesting patches of modules in the
         # same root package. Properly supporting such nested patches would
@@ -99,39 +185,31 @@ def _patch_package_module(module_name, additional_modules=None):
                     _currently_patched_packages[root_module]))
         _currently_patched_packages[root_module] = module_name
         try:
-            original_modules = set(sys.modules)
+            original_modules = set(saved_modules)
             original_modules.add(module_name)
-            saver.save(*original_modules)
-            # Determine which modules (apart from the target module) the
-            # patching process will add to sys.modules, and freeze their state.
-            # Avoid freezing all of sys.modules, as eventlet caches patched
-            # modules in sys.modules.
-            importlib.import_module(module_name)
-            new_modules = set(sys.modules) - original_modules
-            utils.delete_sys_modules(new_modules)
-            saver.save(*new_modules)
-
-            utils.delete_sys_modules(
-                list(utils.iter_descendent_module_names(root_module)))
-            # Patch the target module and all of its ancestors, rather than
-            # just the target module, because import_patched caches patched
-            # modules, so subsequent calls to this function must restore the
-            # cached module's ancestry tree to avoid creating a rootless
-            # module.
-            for name in ancestors:
-                sys.modules[name] = eventlet.import_patched(name)
-            # Due to patched module caching, patches only import a module's
-            # dependencies the first time. Make repeat calls as consistent
-            # as possible by deregistering all unpatched modules in the root
-            # package from sys.modules.
-            utils.delete_sys_modules(
-                set(utils.iter_descendent_module_names(root_module)) -
-                set(ancestors))
+            original_descendants = frozenset(
+                utils.iter_descendent_module_names(root_module))
+            patched_ancestors = _patched_module_cache.get(module_name)
+            if (patched_ancestors is not None and
+                    sys.modules.get(_PATCHED_MODULE_PREFIX + module_name) is
+                    patched_ancestors[-1][1]):
+                # The module is still patched, so skip straight to
+                # reinstalling its patched ancestry tree.
+                utils.delete_sys_modules(original_descendants)
+                sys.modules.update(patched_ancestors)
+            else:
+                _install_patched_module(
+                    module_name, ancestors, original_modules,
+                    original_descendants, added_modules)
             yield sys.modules[module_name]
         finally:
             del _currently_patched_packages[root_module]
     finally:
-        saver.restore()
+        try:
+            utils.delete_sys_modules(added_modules)
+            sys.modules.update(saved_modules)
+        finally:
+            release_lock()
 
 
 try:
@@ -155,27 +233,93 @@ else:
     _patch_httplib = functools.partial(_patch_package_module, 'http.client')
 
 
-httplib = _patch_httplib().__enter__()
+# Functions which patch the modules exposed by this module, keyed on the
+# attribute name of each module. Patching is deferred until first access,
+# sparing processes which never use a module the cost of patching it.
+_module_loaders = collections.OrderedDict()
 
-try:
-    importlib.import_module('httplib2')
-except ImportError:
-    pass
-else:
-    with _patch_httplib():
-        httplib2 = eventlet.import_patched('httplib2')
-    _nr_instrument(httplib2, 'newrelic.hooks.external_httplib2')
+# Held while loading a module upon first access.
+_module_load_lock = threading.RLock()
 
 
-try:
-    importlib.import_module('requests')
-except ImportError:
-    pass
-else:
-    requests = _patch_package_module('requests').__enter__()
-    _nr_instrument(
-        requests.api,
-        'newrelic.hooks.external_requests:instrument_requests_api')
-    _nr_instrument(
-        requests.sessions,
-        'newrelic.hooks.external_requests:instrument_requests_sessions')
+def _module_loader(name):
+    """Register the decorated function as the loader of the named module."""
+    def register(loader):
+        _module_loaders[name] = loader
+        return loader
+
+    return register
+
+
+def _import_unpatched(module_name):
+    """Import the unpatched version of a module exposed by this module.
+
+    Importing it before patching means the patched import finds the module's
+    dependencies already loaded, and does the real import without holding the
+    import lock. Modules which are installed but fail to import are treated
+    as absent, by raising AttributeError.
+    """
+    try:
+        return importlib.import_module(module_name)
+    except ImportError:
+        raise AttributeError(
+            'module %r has no attribute %r' % (__name__, module_name))
+
+
+@_module_loader('httplib')
+def _load_httplib():
+    return _patch_httplib().__enter__()
+
+
+if utils.module_exists('httplib2'):
+    @_module_loader('httplib2')
+    def _load_httplib2():
+        # The patched import would otherwise leave httplib2's dependencies,
+        # such as httplib, in sys.modules bound to green sockets.
+        _import_unpatched('httplib2')
+        with _patch_httplib():
+            httplib2 = eventlet.import_patched('httplib2')
+        _nr_instrument(httplib2, 'newrelic.hooks.external_httplib2')
+        return httplib2
+
+
+if utils.module_exists('requests'):
+    @_module_loader('requests')
+    def _load_requests():
+        _import_unpatched('requests')
+        requests = _patch_package_module('requests').__enter__()
+        _nr_instrument(
+            requests.api,
+            'newrelic.hooks.external_requests:instrument_requests_api')
+        _nr_instrument(
+            requests.sessions,
+            'newrelic.hooks.external_requests:instrument_requests_sessions')
+        return requests
+
+
+def __getattr__(name):
+    """Patch and return the named module upon first access (PEP 562)."""
+    try:
+        loader = _module_loaders[name]
+    except KeyError:
+        raise AttributeError(
+            'module %r has no attribute %r' % (__name__, name))
+    # Serialize first accesses, so that concurrent ones neither patch the
+    # module twice nor instrument it twice. Use a lock of this module's own,
+    # rather than the import lock, as loaders import modules.
+    with _module_load_lock:
+        module = globals().get(name)
+        if module is None:
+            module = globals()[name] = loader()
+    return module
+
+
+if sys.version_info < (3, 7):
+    # Python versions predating PEP 562 ignore module-level __getattr__, so
+    # patch every module upfront, omitting those which fail to import.
+    for _name in list(_module_loaders):
+        try:
+            __getattr__(_name)
+        except AttributeError:
+            del _module_loaders[_name]
+    del _name
@@ -1,14 +1,14 @@
 from __future__ import absolute_import
 
 import functools
-import inspect
 import logging
 import sys
+import types
 
 import eventlet
-import six
 
 from .timeout import Timeout
+from .utils import reraise
 
 logger = logging.getLogger(__name__)
 
@@ -25,14 +25,19 @@ def safe_timeouts(fn):
         try:
             return fn(*args, **kwargs)
         except eventlet.Timeout as e:
-            if isinstance(e, Exception):
+            # Check for the common case of our own Timeout class by identity
+            # before falling back to the MRO walk of isinstance.
+            if type(e) is Timeout or isinstance(e, Exception):
                 raise
             logging.error(
                 'Caught timeout of class %s.%s deriving from BaseException'
                 ' rather than Exception' % (
                     e.__module__, e.__class__.__name__,))
-            six.reraise(Timeout, None, sys.exc_info()[2])
+            reraise(Timeout, None, sys.exc_info()[2])
 
-    if inspect.isfunction(fn):
+    # Equivalent to inspect.isfunction, without importing inspect. Only plain
+    # functions are wrapped, as functools.wraps would copy the attributes of
+    # classes and instances onto the wrapper.
+    if isinstance(fn, types.FunctionType):
         wrapped = functools.wraps(fn)(wrapped)
     return wrapped
@@ -0,0 +1,10 @@
+"""Package which registers modules directly in sys.modules."""
+from __future__ import absolute_import
+
+import sys
+import types
+
+from . import child
+
+sys.modules[__name__ + '.alias'] = child
+sys.modules[__name__ + '_runtime'] = types.ModuleType(__name__ + '_runtime')
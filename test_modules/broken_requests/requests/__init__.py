@@ -0,0 +1,4 @@
+"""Package which is installed, but fails to import."""
+from __future__ import absolute_import
+
+import ss_eventlet_nonexistent_module  # noqa
@@ -2,35 +2,31 @@ from __future__ import absolute_import
 
 import abc
 import collections
-import functools
 import importlib
-import inspect
-import math
 import operator
+import socket
 import sys
+import threading
 import time
-from multiprocessing import Process, Queue
+from contextlib import contextmanager
+from multiprocessing import Pipe, Process
 
 import mock
 import pytest
 from eventlet.support import six
 
+import ss_eventlet
 from ss_eventlet import Timeout, green, utils
 
-try:
-    # python 2
-    import Queue as queue
-except ImportError:
-    # python 3
-    import queue
-
 try:
     # python 2
     from BaseHTTPServer import (
         BaseHTTPRequestHandler, HTTPServer as _HTTPServer)
+    from SocketServer import ThreadingMixIn
 except ImportError:
     # python 3
     from http.server import BaseHTTPRequestHandler, HTTPServer as _HTTPServer
+    from socketserver import ThreadingMixIn
 
 
 HTTPResponse = collections.namedtuple(
@@ -41,73 +37,86 @@ class HTTPServerStartupTimeout(Exception):
     pass
 
 
-class HTTPServer(_HTTPServer):
+class HTTPServer(ThreadingMixIn, _HTTPServer):
     allow_reuse_address = False
+    # Handle each connection in its own thread, so that connections abandoned
+    # by timed out clients do not hold up subsequent tests.
+    daemon_threads = True
 
     def handle_error(self, request, client_address):
         pass
 
 
 class SlowRequestHandler(BaseHTTPRequestHandler):
-    OUTPUT_RATE = 0.1
+    CONTENT = b'1'
 
     def do_GET(self):
-        nbytes = int(math.ceil(
-            float(self.server.min_response_time)/self.OUTPUT_RATE))
         self.send_response(200)
         self.send_header('Content-Type', 'text/plain')
-        self.send_header('Content-Length', str(nbytes))
+        self.send_header('Content-Length', str(len(self.CONTENT)))
         self.end_headers()
-        for _ in range(nbytes):
-            time.sleep(self.OUTPUT_RATE)
-            self.wfile.write(b'1')
-            self.wfile.flush()
+        # Withhold the body until the minimum response time has elapsed.
+        if self.server.min_response_time:
+            time.sleep(self.server.min_response_time)
+        self.wfile.write(self.CONTENT)
+        self.wfile.flush()
 
     def log_message(self, fmt, *args):
         pass
 
 
 class HTTPServerProcess(Process):
+    """Worker process which starts an HTTP server for each job it receives.
+
+    Each server handles a single request, after which the process awaits its
+    next job, so that one process can serve many tests. Requests are handled
+    in their own threads, so the process is free again as soon as the
+    request arrives.
+    """
     DEFAULT_PROCESS_TIMEOUT = 5.0
 
-    def __init__(self, min_response_time, **kwargs):
+    def __init__(self):
         super(HTTPServerProcess, self).__init__()
-        self.min_response_time = min_response_time
-        self.max_request_wait = kwargs.get(
-            'max_request_wait', self.DEFAULT_PROCESS_TIMEOUT)
+        self.daemon = True
+        self.conn, self.worker_conn = Pipe()
 
     def run(self):
-        server = HTTPServer(('', 0), SlowRequestHandler)
-        server.min_response_time = self.min_response_time
-        server.timeout = self.max_request_wait
-        self.queue.put(server.server_port)
-        server.handle_request()
-
-    def start(self, timeout=NotImplemented):
-        if timeout is NotImplemented:
-            timeout = self.DEFAULT_PROCESS_TIMEOUT
-        if hasattr(self, 'process'):
-            raise RuntimeError('The process has already been started')
-        self.queue = Queue()
-        super(HTTPServerProcess, self).start()
-        try:
-            self.port = self.queue.get(timeout)
-        except queue.Empty:
+        conn = self.worker_conn
+        for min_response_time in iter(conn.recv, None):
+            server = HTTPServer(('', 0), SlowRequestHandler)
+            try:
+                server.min_response_time = min_response_time
+                server.timeout = self.DEFAULT_PROCESS_TIMEOUT
+                conn.send(server.server_port)
+                server.handle_request()
+            finally:
+                server.server_close()
+            conn.send(None)
+
+    @contextmanager
+    def server(self, min_response_time):
+        """Start a server handling a single request and yield its URL."""
+        self.conn.send(min_response_time)
+        if not self.conn.poll(self.DEFAULT_PROCESS_TIMEOUT):
             raise HTTPServerStartupTimeout()
+        port = self.conn.recv()
+        try:
+            yield 'http://localhost:{}/'.format(port)
+        finally:
+            # Wait out the server, which gives up on the request after
+            # DEFAULT_PROCESS_TIMEOUT, so that the next job's port is not
+            # confused with this job's completion.
+            if self.conn.poll(2 * self.DEFAULT_PROCESS_TIMEOUT):
+                self.conn.recv()
 
-    def stop(self, timeout=NotImplemented):
-        if timeout is NotImplemented:
-            timeout = self.DEFAULT_PROCESS_TIMEOUT
-        self.join(timeout)
-        if self.is_alive():
-            self.terminate()
-
-    def __enter__(self):
-        self.start()
-        return 'http://localhost:{}/'.format(self.port)
 
-    def __exit__(self, exc_type, value, traceback):
-        self.terminate()
+@pytest.yield_fixture(scope='session')
+def http_server_process():
+    process = HTTPServerProcess()
+    process.start()
+    yield process
+    process.terminate()
+    process.join(HTTPServerProcess.DEFAULT_PROCESS_TIMEOUT)
 
 
 class HTTPModuleTests(object):
@@ -121,23 +130,21 @@ class HTTPModuleTests(object):
     def standard_requestor(self):
         raise NotImplementedError()
 
-    @pytest.fixture
-    def http_server_factory(self, request_timeout):
-        return functools.partial(HTTPServerProcess, request_timeout + 0.1)
+    @pytest.yield_fixture
+    def server_root(self, http_server_process, request_timeout):
+        with http_server_process.server(request_timeout + 0.1) as url:
+            yield url
 
     @pytest.mark.parametrize('request_timeout', [0, 0.1])
     def test_eventlet_requests_honor_timeout(
-            self, http_server_factory, eventlet_requestor, request_timeout):
-        with http_server_factory() as server_root,\
-                pytest.raises(Timeout),\
-                Timeout(request_timeout):
+            self, server_root, eventlet_requestor, request_timeout):
+        with pytest.raises(Timeout), Timeout(request_timeout):
             eventlet_requestor(server_root)
 
     @pytest.mark.parametrize('request_timeout', [0])
     def test_standard_requests_ignore_timeout(
-            self, http_server_factory, standard_requestor, request_timeout):
-        with http_server_factory() as server_root,\
-                Timeout(request_timeout):
+            self, server_root, standard_requestor, request_timeout):
+        with Timeout(request_timeout):
             response = standard_requestor(server_root)
             assert response.status_code == 200
 
@@ -148,6 +155,99 @@ def restore_sys_modules():
         yield
 
 
+@pytest.mark.skipif(
+    sys.version_info < (3, 7),
+    reason='Module __getattr__ requires python 3.7 or later')
+def test_module_patching_deferred(restore_sys_modules):
+    utils.delete_sys_modules(
+        set(utils.iter_descendent_module_names('requests')) |
+        set([green.__name__]))
+    with mock.patch.object(ss_eventlet, 'green', green):
+        deferred_green = importlib.import_module(green.__name__)
+    assert 'requests' not in vars(deferred_green)
+    assert 'requests' not in sys.modules
+    requests = deferred_green.requests
+    assert vars(deferred_green)['requests'] is requests
+    assert deferred_green.requests is requests
+
+
+def test_unimportable_module_omitted(restore_sys_modules):
+    utils.delete_sys_modules(
+        set(utils.iter_descendent_module_names('requests')) |
+        set([green.__name__]))
+    with mock.patch.object(sys, 'path', ['test_modules/broken_requests'] +
+                           sys.path),\
+            mock.patch.object(ss_eventlet, 'green', green):
+        broken_green = importlib.import_module(green.__name__)
+        assert not hasattr(broken_green, 'requests')
+    assert hasattr(broken_green, 'httplib')
+
+
+def test_concurrent_first_access_loads_once():
+    loading = threading.Event()
+    finish_loading = threading.Event()
+    module = object()
+
+    def loader():
+        loading.set()
+        finish_loading.wait(1)
+        return module
+
+    loader = mock.Mock(side_effect=loader)
+    results = []
+
+    def access():
+        results.append(green.__getattr__('test_module'))
+
+    threads = [threading.Thread(target=access) for _ in range(2)]
+    with mock.patch.dict(green._module_loaders, {'test_module': loader}),\
+            mock.patch.dict(vars(green)):
+        threads[0].start()
+        assert loading.wait(1)
+        threads[1].start()
+        # Give the second thread time to reach the loader if unserialized.
+        time.sleep(0.05)
+        finish_loading.set()
+        for thread in threads:
+            thread.join(1)
+    assert loader.call_count == 1
+    assert results == [module, module]
+
+
+@pytest.fixture(scope='session')
+def core_module_names():
+    """Names of the core modules which eventlet patches, found without
+    importing them."""
+    ModuleInfo = collections.namedtuple('ModuleInfo', ('names', 'required'))
+    core_modules = tuple(ModuleInfo(*i) for i in (
+        ('os', True),
+        (('Queue', 'queue'), True),
+        ('select', True),
+        ('selectors', False),
+        ('socket', True),
+        ('ssl', False),
+        ('subprocess', True),
+        ('time', True),
+        (('thread', '_thread'), True),
+        ('threading', True),
+    ))
+    module_names = set()
+    for info in core_modules:
+        names = info.names
+        if isinstance(names, six.string_types):
+            names = [names]
+        for name in names:
+            if utils.module_exists(name):
+                module_names.add(name)
+                break
+        else:
+            if info.required:
+                raise RuntimeError(
+                    'Unable to locate any module matching names: %s' %
+                    ', '.join(names))
+    return frozenset(module_names)
+
+
 class GreenModuleSandboxingTests(object):
     __metaclass__ = abc.ABCMeta
 
@@ -155,39 +255,18 @@ class GreenModuleSandboxingTests(object):
     def module_to_green(self):
         raise NotImplementedError()
 
-    def test_module_sandboxing(self, restore_sys_modules, module_to_green):
-        ModuleInfo = collections.namedtuple(
-            'ModuleInfo', ('names', 'required'))
-        core_modules = tuple(ModuleInfo(*i) for i in (
-            ('os', True),
-            (('Queue', 'queue'), True),
-            ('select', True),
-            ('selectors', False),
-            ('socket', True),
-            ('ssl', False),
-            ('subprocess', True),
-            ('time', True),
-            (('thread', '_thread'), True),
-            ('threading', True),
-        ))
-        affected_modules = set()
-        for info in core_modules:
-            names = info.names
-            if isinstance(names, six.string_types):
-                names = [names]
-            for name in names:
-                try:
-                    importlib.import_module(name)
-                except ImportError:
-                    pass
-                else:
-                    affected_modules.add(name)
-                    break
-            else:
-                if info.required:
-                    raise RuntimeError(
-                        'Unable to locate any module matching names: %s' %
-                        ', '.join(names))
+    @pytest.fixture
+    def green_attribute(self):
+        raise NotImplementedError()
+
+    def test_module_sandboxing(
+            self, restore_sys_modules, core_module_names, module_to_green,
+            green_attribute):
+        affected_modules = set(core_module_names)
+        # The session fixture only locates the core modules, so load them
+        # inside the sys.modules sandbox.
+        for name in affected_modules:
+            importlib.import_module(name)
         root_module = module_to_green.split('.', 1)[0]
         descendent_modules = set(
             utils.iter_descendent_module_names(root_module))
@@ -209,13 +288,15 @@ class GreenModuleSandboxingTests(object):
         )
         real_modules = [
             importlib.import_module(m) for m in affected_modules]
+        real_module_ids = set(id(m) for m in real_modules)
         refs_by_module_name = {}
         for module in real_modules:
             module_refs = refs_by_module_name[module.__name__] = {}
-            for attr, value in inspect.getmembers(module):
-                if value in real_modules:
+            for attr, value in six.iteritems(vars(module)):
+                if id(value) in real_module_ids:
                     module_refs[attr] = value
-        importlib.import_module(green.__name__)
+        # Patching is deferred until the green module is first accessed.
+        getattr(importlib.import_module(green.__name__), green_attribute)
         current_modules = [
             importlib.import_module(m) for m in affected_modules]
         assert [id(m) for m in current_modules] == \
@@ -232,6 +313,10 @@ class TestRequestsModule(HTTPModuleTests, GreenModuleSandboxingTests):
     def module_to_green(self):
         return 'requests'
 
+    @pytest.fixture
+    def green_attribute(self):
+        return 'requests'
+
     @classmethod
     @pytest.fixture(scope='class', autouse=True)
     def requests(cls):
@@ -264,6 +349,10 @@ class TestHttplibModule(HTTPModuleTests, GreenModuleSandboxingTests):
         else:
             return 'http.client'
 
+    @pytest.fixture
+    def green_attribute(self):
+        return 'httplib'
+
     @pytest.fixture
     def eventlet_requestor(self):
         return self.make_requestor(green.httplib)
@@ -293,6 +382,10 @@ class TestHttplib2Module(HTTPModuleTests, GreenModuleSandboxingTests):
     def module_to_green(self):
         return 'httplib2'
 
+    @pytest.fixture
+    def green_attribute(self):
+        return 'httplib2'
+
     @classmethod
     @pytest.fixture(scope='class', autouse=True)
     def httplib2(cls):
@@ -302,6 +395,14 @@ class TestHttplib2Module(HTTPModuleTests, GreenModuleSandboxingTests):
     def eventlet_requestor(self):
         return self.make_requestor(green.httplib2)
 
+    def test_httplib_left_unpatched(self):
+        green.httplib2
+        try:
+            httplib = importlib.import_module('http.client')
+        except ImportError:
+            httplib = importlib.import_module('httplib')
+        assert httplib.socket is socket
+
     @pytest.fixture
     def standard_requestor(self):
         return self.make_requestor(self.httplib2_module)
@@ -462,6 +563,48 @@ class TestPatchPackageModule(object):
             with validation_context:
                 self.parent_child_test(validation_context, patch_child)
 
+    @pytest.mark.parametrize(
+        'package_module_name, package_exports_child, child_imports_package',
+        [
+            ('cyclical_pkg', True, True),
+        ])
+    def test_repeat_patch_reuses_dependencies(self, validation_context):
+        module_name = validation_context.child_module_name
+        with mock.patch.dict(green._module_dependency_cache, clear=True):
+            with validation_context:
+                self.parent_child_test(validation_context, True)
+            assert module_name in green._module_dependency_cache
+            # Bypass the patched module fast path, which never probes.
+            with mock.patch.dict(green._patched_module_cache, clear=True),\
+                    mock.patch.object(
+                        green.importlib, 'import_module') as import_module:
+                with validation_context:
+                    self.parent_child_test(validation_context, True)
+            assert not import_module.called
+
+    @pytest.mark.parametrize(
+        'package_module_name, package_exports_child, child_imports_package',
+        [
+            ('cyclical_pkg', True, True),
+        ])
+    @pytest.mark.parametrize('patch_child', [False, True])
+    def test_repeat_patch_reuses_patched_module(
+            self, validation_context, patch_child):
+        with validation_context:
+            self.parent_child_test(validation_context, patch_child)
+        with mock.patch.object(green.eventlet, 'import_patched') as patch:
+            with validation_context:
+                self.parent_child_test(validation_context, patch_child)
+        assert not patch.called
+
+    def test_directly_registered_modules_removed(self):
+        module_names = ('aliasing_pkg.alias', 'aliasing_pkg_runtime')
+        with mock.patch.dict(green._module_dependency_cache, clear=True):
+            with green._patch_package_module('aliasing_pkg.child', []):
+                assert 'aliasing_pkg.alias' not in sys.modules
+        for module_name in module_names:
+            assert module_name not in sys.modules
+
     def parent_child_test(self, validation_context, patch_child):
         module_name = (
             validation_context.child_module_name if patch_child else
@@ -2,6 +2,7 @@ from __future__ import absolute_import
 
 import imp
 import inspect
+import sys
 
 import mock
 import pytest
@@ -9,7 +10,7 @@ import pytest
 import ss_eventlet.utils
 from ss_eventlet.utils import (
     delete_sys_modules, iter_ancestor_module_names,
-    iter_descendent_module_names)
+    iter_descendent_module_names, module_exists)
 
 
 @pytest.yield_fixture
@@ -59,6 +60,27 @@ def test_iter_ancestor_module_names(module_name, expected):
         assert list(iter_ancestor_module_names(module_name)) == expected
 
 
+def test_iter_ancestor_module_names_memoized():
+    assert (iter_ancestor_module_names('x.y') is
+            iter_ancestor_module_names('x.y'))
+
+
+@pytest.mark.parametrize('module_name,expected', [
+    ('sys', True),
+    ('ss_eventlet', True),
+    ('ss_eventlet_nonexistent_module', False),
+])
+def test_module_exists(module_name, expected):
+    assert module_exists(module_name) == expected
+
+
+def test_module_exists_without_spec():
+    module = imp.new_module('ss_eventlet_runtime_module')
+    module.__spec__ = None
+    with mock.patch.dict(sys.modules, {module.__name__: module}):
+        assert module_exists(module.__name__)
+
+
 @pytest.mark.parametrize('to_delete,sys_modules', [
     # module to delete has not been loaded
     (['x'], {'a': None}),
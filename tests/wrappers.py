@@ -45,6 +45,26 @@ class SafeTimeoutsTestCase(unittest.TestCase):
         safe_timeouts(Caller())()
         self.assertTrue(called())
 
+    def test_wrap_class_does_not_copy_attributes(self):
+        class Caller(object):
+            x = 1
+
+        wrapped = safe_timeouts(Caller)
+        self.assertIsInstance(wrapped(), Caller)
+        self.assertFalse(hasattr(wrapped, 'x'))
+        self.assertFalse(hasattr(wrapped, '__wrapped__'))
+
+    def test_wrap_object_does_not_copy_attributes(self):
+        class Caller(object):
+            def __call__(self):
+                pass
+
+        caller = Caller()
+        caller.x = 1
+        wrapped = safe_timeouts(caller)
+        self.assertFalse(hasattr(wrapped, 'x'))
+        self.assertFalse(hasattr(wrapped, '__wrapped__'))
+
     def pass_through_exception_test(self, exception):
         raiser = self.create_raiser(exception)
         try: